@@ -0,0 +1,165 @@
+"""Per-line log processing for the alert watcher.
+
+This module does no I/O so it can be compiled ahead of time with mypyc
+(`mypyc parser.py`). Python imports the compiled extension when it sits next
+to this file and falls back to the pure-Python source otherwise.
+"""
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+# (message, alert_type, pool, error_rate) for send_slack_alert
+Alert = Tuple[str, str, Optional[str], Optional[float]]
+
+# IS_5XX[status] is 1 for 500-599, else 0; covers every 3-digit status code
+IS_5XX = bytes(1 if 500 <= i <= 599 else 0 for i in range(1000))
+
+
+def parse_line(line: str) -> Optional[Tuple[str, int]]:
+    """Extract (pool, upstream_status) from a blue_green log line, or None.
+
+    Accepts exactly what watcher.LOG_REGEX accepts at the last " pool:" token.
+    """
+    idx = line.rfind(" pool:")
+    if idx == -1:
+        return None
+    # pool:<pool> release:<release> upstream_status:<status>[,] ...
+    fields = line[idx + 6:].split(None, 3)
+    if len(fields) < 3 or fields[0] == "-":
+        return None
+    if not fields[1].startswith("release:") or len(fields[1]) == 8:
+        return None
+    if not fields[2].startswith("upstream_status:"):
+        return None
+    status = fields[2][16:].rstrip(",")
+    if not status.isdecimal():
+        return None
+    return fields[0], int(status)
+
+
+@dataclass
+class State:
+    """Sliding error window and alert bookkeeping carried between log lines."""
+    active_pool: str
+    window_size: int
+    error_rate_threshold: float  # in %
+    alert_cooldown_sec: float
+    parse: Callable[[str], Optional[Tuple[str, int]]] = parse_line
+    # Fixed-size ring of 0/1 flags (1 = 5xx) over the last window_size requests
+    ring: bytearray = field(default_factory=bytearray)
+    ring_idx: int = 0
+    ring_filled: int = 0
+    error_count: int = 0
+    error_rate: float = 0.0
+    last_failover_pool: str = ""
+    # Monotonic seconds of the last alert; -inf so the first alert is never in cooldown
+    last_failover_alert: float = float("-inf")
+    last_error_rate_alert: float = float("-inf")
+    error_rate_breached: bool = False
+    # Alerts raised by process_batch, drained by the caller
+    alerts: List[Alert] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        if not self.ring:
+            self.ring = bytearray(self.window_size)
+        if not self.last_failover_pool:
+            self.last_failover_pool = self.active_pool
+
+
+def process_line(line: str, state: State) -> bool:
+    """Update state from one log line; return False if it carries no upstream fields."""
+    return process_batch([line], state) == 1
+
+
+def process_batch(lines: List[str], state: State) -> int:
+    """Update state from a batch of log lines; return how many carried upstream fields.
+
+    State is copied into locals for the loop and written back once per batch, so
+    the per-line work only touches locals when this runs as plain Python.
+    """
+    parse = state.parse
+    is_5xx = IS_5XX
+    monotonic = time.monotonic
+    alerts = state.alerts
+    active_pool = state.active_pool
+    window_size = state.window_size
+    threshold = state.error_rate_threshold
+    cooldown = state.alert_cooldown_sec
+    ring = state.ring
+    ring_idx = state.ring_idx
+    ring_filled = state.ring_filled
+    error_count = state.error_count
+    error_rate = state.error_rate
+    last_failover_pool = state.last_failover_pool
+    last_failover_alert = state.last_failover_alert
+    last_error_rate_alert = state.last_error_rate_alert
+    error_rate_breached = state.error_rate_breached
+
+    parsed_count = 0
+    for line in lines:
+        parsed = parse(line)
+        if parsed is None:
+            continue
+        parsed_count += 1
+
+        pool, upstream_status = parsed
+        is_err = is_5xx[upstream_status] if upstream_status < 1000 else 0
+        if ring_filled == window_size:
+            error_count -= ring[ring_idx]
+        else:
+            ring_filled += 1
+        ring[ring_idx] = is_err
+        error_count += is_err
+        ring_idx += 1
+        if ring_idx == window_size:
+            ring_idx = 0
+            # Once per lap, recount the ring in C to catch any drift in the running count
+            error_count = ring.count(1)
+        now = monotonic()
+
+        if pool != last_failover_pool:
+            if now - last_failover_alert >= cooldown:
+                alerts.append((
+                    f"Failover detected! Pool switched from `{last_failover_pool}` → `{pool}`",
+                    "failover", pool, None
+                ))
+                last_failover_alert = now
+            last_failover_pool = pool
+
+        elif pool == active_pool and last_failover_pool != active_pool:
+            if now - last_failover_alert >= cooldown:
+                alerts.append((
+                    f"Primary pool `{active_pool}` is now serving traffic again.",
+                    "info", active_pool, None
+                ))
+                last_failover_alert = now
+            last_failover_pool = active_pool
+
+        if ring_filled == window_size:
+            error_rate = error_count * 100.0 / window_size
+
+            if error_rate > threshold:
+                if not error_rate_breached and now - last_error_rate_alert >= cooldown:
+                    alerts.append((
+                        f"High error rate detected: {error_rate:.2f}% 5xx responses over last {window_size} requests",
+                        "error_rate", active_pool, error_rate
+                    ))
+                    last_error_rate_alert = now
+                    error_rate_breached = True
+            elif error_rate_breached and now - last_error_rate_alert >= cooldown:
+                alerts.append((
+                    f"Error rate recovered: {error_rate:.2f}% 5xx responses over last {window_size} requests",
+                    "info", active_pool, error_rate
+                ))
+                last_error_rate_alert = now
+                error_rate_breached = False
+
+    state.ring_idx = ring_idx
+    state.ring_filled = ring_filled
+    state.error_count = error_count
+    state.error_rate = error_rate
+    state.last_failover_pool = last_failover_pool
+    state.last_failover_alert = last_failover_alert
+    state.last_error_rate_alert = last_error_rate_alert
+    state.error_rate_breached = error_rate_breached
+    return parsed_count
@@ -0,0 +1,139 @@
+import os
+import random
+from collections import deque
+
+import pytest
+
+os.environ.setdefault("SLACK_WEBHOOK_URL", "https://hooks.slack.com/services/test")
+
+from parser import IS_5XX, State, parse_line, process_batch, process_line
+from watcher import parse_line_regex
+
+WINDOW = 7
+ACCESS_LOG = os.path.join(os.path.dirname(__file__), "..", "nginx_logs", "access.log")
+
+PREFIX = '172.18.0.1 - - [31/Oct/2025:19:37:21 +0000] "GET / HTTP/1.1" 200 57 '
+EDGE_LINES = [
+    # (line, expected)
+    (PREFIX + "pool:blue release:v1.2.0 upstream_status:200 upstream:172.18.0.2:3000\n", ("blue", 200)),
+    (PREFIX + "pool:blue-canary release:v1-blue upstream_status:503 upstream:172.18.0.2:3000\n", ("blue-canary", 503)),
+    (PREFIX + "pool:green release:v1 upstream_status:502, 200 upstream:172.18.0.2:3000, 172.18.0.3:3000\n", ("green", 502)),
+    (PREFIX + "pool:green release:v1 upstream_status:200", ("green", 200)),
+    (PREFIX + "pool:- release:- upstream_status:502 upstream:172.18.0.2:3000\n", None),
+    (PREFIX + "pool:- release:- upstream_status:- upstream:-\n", None),
+    (PREFIX + "pool:blue release: upstream_status:200 upstream:-\n", None),
+    (PREFIX + "pool:blue upstream_status:200 upstream:-\n", None),
+    (PREFIX + "pool:blue release:v1 upstream_status:200abc upstream:-\n", None),
+    ('1.2.3.4 - - [x] "GET /?q= pool:green release:x upstream_status:500 HTTP/1.1" 200 5 '
+     "pool:blue release:v1 upstream_status:200 upstream:-\n", ("blue", 200)),
+    ('127.0.0.1 - - [31/Oct/2025:13:30:00 +0000] "GET /error HTTP/1.1" 500 123 "-" "curl/7.68.0"\n', None),
+]
+
+
+def test_edge_lines():
+    for line, expected in EDGE_LINES:
+        assert parse_line(line) == expected, line
+        assert parse_line_regex(line) == expected, line
+
+
+def test_parsers_agree_on_access_log():
+    with open(ACCESS_LOG) as f:
+        for line in f:
+            assert parse_line(line) == parse_line_regex(line), line
+
+
+def make_lines(seed, count=2000):
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        if rng.random() < 0.05:
+            lines.append('127.0.0.1 - - [x] "GET /error HTTP/1.1" 500 123 "-" "curl/7.68.0"\n')
+            continue
+        pool = "blue" if rng.random() < 0.9 else "green"
+        status = rng.choice([200, 200, 200, 404, 500, 502, 503, 599, 600, 1503])
+        lines.append(PREFIX + f"pool:{pool} release:v1 upstream_status:{status} upstream:-\n")
+    return lines
+
+
+def new_state(cooldown):
+    return State(active_pool="blue", window_size=WINDOW, error_rate_threshold=20.0, alert_cooldown_sec=cooldown)
+
+
+def baseline_alerts(lines):
+    """The original watch_logs loop (deque window, no cooldown), as a reference."""
+    window = deque(maxlen=WINDOW)
+    last_pool, breached, alerts = "blue", False, []
+    for line in lines:
+        parsed = parse_line(line)
+        if parsed is None:
+            continue
+        pool, status = parsed
+        window.append(status)
+        if pool != last_pool:
+            alerts.append((f"Failover detected! Pool switched from `{last_pool}` → `{pool}`", "failover", pool, None))
+            last_pool = pool
+        elif pool == "blue" and last_pool != "blue":
+            alerts.append(("Primary pool `blue` is now serving traffic again.", "info", "blue", None))
+            last_pool = "blue"
+        if len(window) == WINDOW:
+            rate = sum(1 for s in window if 500 <= s <= 599) * 100.0 / WINDOW
+            msg = f"{rate:.2f}% 5xx responses over last {WINDOW} requests"
+            if rate > 20.0:
+                if not breached:
+                    alerts.append((f"High error rate detected: {msg}", "error_rate", "blue", rate))
+                    breached = True
+            elif breached:
+                alerts.append((f"Error rate recovered: {msg}", "info", "blue", rate))
+                breached = False
+    return alerts
+
+
+def run_in_batches(lines, sizes, cooldown):
+    state, statuses, i = new_state(cooldown), [], 0
+    for size in sizes:
+        batch = lines[i:i + size]
+        i += size
+        process_batch(batch, state)
+        statuses += [parsed[1] for parsed in map(parse_line, batch) if parsed]
+        window = statuses[-WINDOW:]
+        assert state.error_count == sum(IS_5XX[s] if s < 1000 else 0 for s in window)
+        if len(window) == WINDOW:
+            assert state.error_rate == state.error_count * 100.0 / WINDOW
+    return state
+
+
+def random_sizes(rng, total):
+    sizes = []
+    while total > 0:
+        sizes.append(min(total, rng.randint(1, 3 * WINDOW)))
+        total -= sizes[-1]
+    return sizes
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("cooldown", [0.0, 1e9])
+def test_batch_splits_give_identical_state(seed, cooldown):
+    lines = make_lines(seed)
+    whole = run_in_batches(lines, [len(lines)], cooldown)
+    for sizes in ([1] * len(lines), random_sizes(random.Random(seed), len(lines))):
+        split = run_in_batches(lines, sizes, cooldown)
+        assert split.alerts == whole.alerts
+        assert split.error_count == whole.error_count
+        assert split.error_rate == whole.error_rate
+        assert split.ring_idx == whole.ring_idx
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_alerts_match_baseline_loop(seed):
+    lines = make_lines(seed)
+    state = run_in_batches(lines, random_sizes(random.Random(seed), len(lines)), 0.0)
+    assert state.alerts == baseline_alerts(lines)
+    assert len(state.alerts) > 10
+
+
+def test_process_line_wraps_process_batch():
+    lines = make_lines(0, 300)
+    state = new_state(0.0)
+    parsed = [process_line(line, state) for line in lines]
+    assert parsed == [parse_line(line) is not None for line in lines]
+    assert state.alerts == run_in_batches(lines, [len(lines)], 0.0).alerts
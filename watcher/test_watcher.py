@@ -0,0 +1,82 @@
+import json
+import os
+import time
+
+os.environ.setdefault("SLACK_WEBHOOK_URL", "https://hooks.slack.com/services/test")
+
+import pytest
+
+import watcher
+
+TIMESTAMP_PREFIX = "🕒 *Timestamp:* "
+
+
+def baseline_payload(message, alert_type, pool, error_rate, timestamp):
+    """Payload as the original send_slack_alert built it, before serialization."""
+    color = {"failover": "#FF0000", "error_rate": "#FFA500", "info": "#36C5F0"}.get(alert_type, "#36C5F0")
+    emoji = {"failover": "🚨", "error_rate": " ", "info": " "}.get(alert_type, "💡")
+    title = {
+        "failover": "*Failover Detected!*",
+        "error_rate": "*High Error Rate Detected!*",
+        "info": "*Alert Notification*"
+    }.get(alert_type, "*Alert Notification*")
+
+    fields = []
+    if pool:
+        fields.append({"type": "mrkdwn", "text": f"*Active Pool:*\n`{pool}`"})
+    if error_rate is not None:
+        filled = int(error_rate // 5)
+        bar = "█" * filled + "░" * (20 - filled)
+        fields.append({"type": "mrkdwn", "text": f"*Error Rate:*\n`{error_rate:.2f}%`\n{bar}"})
+
+    blocks = [
+        {"type": "header", "text": {"type": "plain_text", "text": f"{emoji} {title}", "emoji": True}},
+        {"type": "section", "fields": fields},
+        {"type": "section", "text": {"type": "mrkdwn", "text": message}},
+        {"type": "context", "elements": [{"type": "mrkdwn", "text": TIMESTAMP_PREFIX + timestamp}]},
+    ]
+    return {"blocks": blocks, "attachments": [{"color": color}]}
+
+
+@pytest.mark.parametrize("dumps", [watcher._dumps, watcher._stdlib_dumps])
+@pytest.mark.parametrize("alert_type", ["failover", "error_rate", "info", "unknown"])
+@pytest.mark.parametrize("pool", [None, "blue"])
+@pytest.mark.parametrize("error_rate", [None, 0.0, 3.5, 100.0])
+def test_queued_body_matches_baseline_payload(monkeypatch, dumps, alert_type, pool, error_rate):
+    monkeypatch.setattr(watcher, "_dumps", dumps)
+    monkeypatch.setattr(watcher, "maintenance_on", lambda: False)
+    watcher._render_summary.cache_clear()
+    message = 'Pool switched from `blue` → `green` "quoted" \\ back'
+
+    watcher.send_slack_alert(message, alert_type=alert_type, pool=pool, error_rate=error_rate)
+    queued_type, body = watcher._alert_q.get_nowait()
+    watcher._alert_q.task_done()
+
+    payload = json.loads(body)
+    stamp = payload["blocks"][3]["elements"][0]["text"]
+    assert stamp.startswith(TIMESTAMP_PREFIX)
+    timestamp = stamp[len(TIMESTAMP_PREFIX):]
+    time.strptime(timestamp, "%Y-%m-%d %H:%M:%S UTC")
+
+    assert queued_type == alert_type
+    assert payload == baseline_payload(message, alert_type, pool, error_rate, timestamp)
+    watcher._render_summary.cache_clear()
+
+
+def test_poll_tail_follows_rotation(monkeypatch, tmp_path):
+    monkeypatch.setattr(watcher, "INotify", None)
+    log = tmp_path / "access.log"
+    log.write_text("old\n")
+    batches = watcher.tail_batches(str(log))
+
+    with open(log, "a") as f:
+        f.write("a\n")
+    assert next(batches) == ["a\n"]
+
+    log.rename(tmp_path / "access.log.1")
+    with open(tmp_path / "access.log.1", "a") as f:
+        f.write("b\n")
+    log.write_text("c\n")
+    assert next(batches) == ["b\n"]
+    assert next(batches) == ["c\n"]
+    batches.close()
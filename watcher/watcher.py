@@ -3,186 +3,328 @@ import os
 import time
 import re
 import json
+import functools
+import queue
+import threading
 import requests
-from collections import deque
-from datetime import datetime, timedelta
-from flask import Flask
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Tuple
+from parser import State, parse_line, process_batch
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj).encode()
+
+try:
+    import orjson
+    _dumps: Callable[[Any], bytes] = orjson.dumps
+except ImportError:
+    _dumps = _stdlib_dumps
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # Fall back to polling in tail()
+    INotify = None
 
 # ====== CONFIG ======
-LOG_PATH = "/var/log/nginx/access.log"
-ACTIVE_POOL = os.environ.get("ACTIVE_POOL", "blue")
-ERROR_RATE_THRESHOLD = float(os.environ.get("ERROR_RATE_THRESHOLD", 2))  # in %
-WINDOW_SIZE = int(os.environ.get("WINDOW_SIZE", 200))
-ALERT_COOLDOWN_SEC = int(os.environ.get("ALERT_COOLDOWN_SEC", 300))
-SLACK_WEBHOOK_URL = os.environ.get("SLACK_WEBHOOK_URL")
-MAINTENANCE_FILE = os.environ.get("MAINTENANCE_FILE", "/watcher/data/maintenance_mode")
-
-if not SLACK_WEBHOOK_URL:
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.environ.get(name, default).lower() == "true"
+
+@dataclass(frozen=True)
+class Config:
+    """Watcher settings, read from the environment once at import."""
+    log_path: str
+    active_pool: str
+    error_rate_threshold: float  # in %
+    window_size: int
+    alert_cooldown_sec: int
+    slack_webhook_url: Optional[str]  # checked right after CONFIG is built
+    maintenance_file: str
+    use_regex_parser: bool
+    enable_chaos_http: bool
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        return cls(
+            log_path="/var/log/nginx/access.log",
+            active_pool=os.environ.get("ACTIVE_POOL", "blue"),
+            error_rate_threshold=float(os.environ.get("ERROR_RATE_THRESHOLD", 2)),
+            window_size=int(os.environ.get("WINDOW_SIZE", 200)),
+            alert_cooldown_sec=int(os.environ.get("ALERT_COOLDOWN_SEC", 300)),
+            slack_webhook_url=os.environ.get("SLACK_WEBHOOK_URL"),
+            maintenance_file=os.environ.get("MAINTENANCE_FILE", "/watcher/data/maintenance_mode"),
+            use_regex_parser=_env_flag("USE_REGEX_PARSER"),
+            enable_chaos_http=_env_flag("ENABLE_CHAOS_HTTP", "true"),
+        )
+
+CONFIG = Config.from_env()
+
+if not CONFIG.slack_webhook_url:
     print("ERROR: SLACK_WEBHOOK_URL not set in environment")
     exit(1)
 
+# ====== SLACK FORMATTING ======
+COLOR_MAP = {
+    "failover": "#FF0000",
+    "error_rate": "#FFA500",
+    "info": "#36C5F0"
+}
+
+EMOJI_MAP = {
+    "failover": "🚨",
+    "error_rate": " ",
+    "info": " "
+}
+
+TITLE_MAP = {
+    "failover": "*Failover Detected!*",
+    "error_rate": "*High Error Rate Detected!*",
+    "info": "*Alert Notification*"
+}
+
+# Header blocks and attachments are shared across payloads and never mutated
+HEADER_BLOCKS = {
+    alert_type: {
+        "type": "header",
+        "text": {"type": "plain_text", "text": f"{EMOJI_MAP[alert_type]} {title}", "emoji": True}
+    }
+    for alert_type, title in TITLE_MAP.items()
+}
+DEFAULT_HEADER_BLOCK = {
+    "type": "header",
+    "text": {"type": "plain_text", "text": "💡 *Alert Notification*", "emoji": True}
+}
+ATTACHMENTS = {alert_type: [{"color": color}] for alert_type, color in COLOR_MAP.items()}
+DEFAULT_ATTACHMENTS = [{"color": "#36C5F0"}]
+
+# Error-rate progress bars indexed by filled cells (one cell per 5%)
+BARS = tuple("█" * i + "░" * (20 - i) for i in range(21))
+
+# ====== SLACK SESSION ======
+# Reused across alerts so the TLS connection to hooks.slack.com stays warm
+_slack = requests.Session()
+_slack.headers["Content-Type"] = "application/json"
+_slack.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+# Pending (alert_type, body) pairs, drained by _alert_worker off the tail thread
+_alert_q: "queue.Queue[Tuple[str, bytes]]" = queue.Queue(maxsize=64)
+
 # ====== STATE ======
-request_window = deque(maxlen=WINDOW_SIZE)
-last_failover_pool = ACTIVE_POOL
-last_failover_alert = datetime.min
-last_error_rate_alert = datetime.min
-error_rate_breached = False
 maintenance_mode_prev = False  # Track previous state to detect changes
-
-LOG_REGEX = re.compile(
-    r'.*pool:(?P<pool>\w+)\s+release:(?P<release>[\w\-]+)\s+upstream_status:(?P<upstream_status>\d+)'
-)
+# Last maintenance flag stat, refreshed every 0.5s
+_maint_checked_at: float = float("-inf")
+_maint_value: bool = False
 
 # ====== HELPERS ======
 def log_console(message: str):
     from datetime import datetime, timezone
     print(f"[{datetime.now(timezone.utc).isoformat()}] {message}", flush=True)
 
-def send_slack_alert(message: str, alert_type="info", pool=None, error_rate=None):
-    if os.path.exists(MAINTENANCE_FILE):
-        log_console(f"(MAINTENANCE MODE) Suppressed alert: {message}")
-        return
+# Same grammar as parser.parse_line; matched at the last " pool:" in the line
+LOG_REGEX = re.compile(
+    r' pool:\s*(\S+)\s+release:\S+\s+upstream_status:(\d+),*(?:\s|$)'
+)
 
-    color_map = {
-        "failover": "#FF0000",
-        "error_rate": "#FFA500",
-        "info": "#36C5F0"
-    }
+def parse_line_regex(line: str):
+    # Anchor at the last " pool:" token, as parse_line does
+    idx = line.rfind(" pool:")
+    if idx == -1:
+        return None
+    match = LOG_REGEX.match(line, idx)
+    if not match or match.group(1) == "-":
+        return None
+    return match.group(1), int(match.group(2))
 
-    emoji_map = {
-        "failover": "🚨",
-        "error_rate": " ",
-        "info": " "
-    }
+def maintenance_on() -> bool:
+    global _maint_checked_at, _maint_value
+    now = time.monotonic()
+    if now - _maint_checked_at > 0.5:
+        _maint_checked_at = now
+        _maint_value = os.path.exists(CONFIG.maintenance_file)
+    return _maint_value
 
-    title_map = {
-        "failover": "*Failover Detected!*",
-        "error_rate": "*High Error Rate Detected!*",
-        "info": "*Alert Notification*"
-    }
+@functools.lru_cache(maxsize=32)
+def _render_summary(alert_type: str, pool, error_rate):
+    """Serialized header/fields blocks and attachments; these only depend on the arguments."""
+    fields = []
+    if pool:
+        fields.append({"type": "mrkdwn", "text": f"*Active Pool:*\n`{pool}`"})
+    if error_rate is not None:
+        bar = BARS[min(int(error_rate // 5), 20)]
+        fields.append({"type": "mrkdwn", "text": f"*Error Rate:*\n`{error_rate:.2f}%`\n{bar}"})
 
-    color = color_map.get(alert_type, "#36C5F0")
-    emoji = emoji_map.get(alert_type, "💡")
-    title = title_map.get(alert_type, "*Alert Notification*")
+    header = HEADER_BLOCKS.get(alert_type, DEFAULT_HEADER_BLOCK)
+    blocks = _dumps(header) + b"," + _dumps({"type": "section", "fields": fields})
+    return blocks, _dumps(ATTACHMENTS.get(alert_type, DEFAULT_ATTACHMENTS))
 
-    blocks = [
-        {
-            "type": "header",
-            "text": {"type": "plain_text", "text": f"{emoji} {title}", "emoji": True}
-        },
-        {"type": "section", "fields": []},
+def send_slack_alert(message: str, alert_type="info", pool=None, error_rate=None):
+    if maintenance_on():
+        log_console(f"(MAINTENANCE MODE) Suppressed alert: {message}")
+        return
+
+    summary, attachments = _render_summary(alert_type, pool, error_rate)
+    details = _dumps([
         {"type": "section", "text": {"type": "mrkdwn", "text": message}},
         {
             "type": "context",
             "elements": [
-                {"type": "mrkdwn", "text": f"🕒 *Timestamp:* {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}"}
+                {"type": "mrkdwn", "text": f"🕒 *Timestamp:* {time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime())}"}
             ]
         }
-    ]
-
-    if pool:
-        blocks[1]["fields"].append({"type": "mrkdwn", "text": f"*Active Pool:*\n`{pool}`"})
-    if error_rate is not None:
-        filled = int(error_rate // 5)
-        bar = "█" * filled + "░" * (20 - filled)
-        blocks[1]["fields"].append({"type": "mrkdwn", "text": f"*Error Rate:*\n`{error_rate:.2f}%`\n{bar}"})
+    ])
 
-    payload = {"blocks": blocks, "attachments": [{"color": color}]}
+    # {"blocks": [header, fields, message, context], "attachments": [...]}
+    body = b'{"blocks":[' + summary + b"," + details[1:] + b',"attachments":' + attachments + b"}"
 
     try:
-        resp = requests.post(SLACK_WEBHOOK_URL, json=payload, timeout=5)
-        resp.raise_for_status()
-        log_console(f"✅ Slack alert sent: {alert_type.upper()}")
-    except Exception as e:
-        log_console(f"❌ Failed to send Slack alert: {e}")
+        _alert_q.put_nowait((alert_type, body))
+    except queue.Full:
+        log_console(f"❌ Slack alert queue full, dropped alert: {alert_type.upper()}")
 
-def tail(f):
-    f.seek(0, 2)
+def _alert_worker():
     while True:
-        line = f.readline()
-        if not line:
+        alert_type, body = _alert_q.get()
+        try:
+            resp = _slack.post(CONFIG.slack_webhook_url, data=body, timeout=5)
+            resp.raise_for_status()
+            log_console(f"✅ Slack alert sent: {alert_type.upper()}")
+        except Exception as e:
+            log_console(f"❌ Failed to send Slack alert: {e}")
+        finally:
+            _alert_q.task_done()
+
+def tail_batches(path):
+    """Yield lists of new lines appended to path, one list per read."""
+    if INotify is not None:
+        try:
+            inotify = _watch_log_dir(path)
+        except OSError as e:  # e.g. ENOSPC/EMFILE watch limits, or no inotify on this filesystem
+            log_console(f"inotify unavailable ({e}), falling back to polling {path}")
+        else:
+            yield from _tail_inotify(path, inotify)
+            return
+    yield from _tail_poll(path)
+
+def _tail_poll(path):
+    f = open(path, "r")
+    f.seek(0, 2)
+    try:
+        while True:
+            yield from _drain(f)
             time.sleep(0.1)
-            continue
-        yield line.strip()
+            try:
+                rotated = os.stat(path).st_ino != os.fstat(f.fileno()).st_ino
+            except FileNotFoundError:
+                rotated = False  # Between rename and recreate; check again next tick
+            if rotated:
+                # Finish the rotated-out file, then follow the new one from the start
+                yield from _drain(f)
+                f = _reopen(path, f)
+    finally:
+        f.close()
+
+def _reopen(path, f):
+    """Open path afresh and close f, or keep f if path is gone again."""
+    try:
+        new_f = open(path, "r")
+    except FileNotFoundError:
+        return f
+    f.close()
+    return new_f
+
+def _drain(f):
+    """Yield every line available in f as 64 KiB readlines() batches."""
+    while True:
+        lines = f.readlines(65536)
+        if not lines:
+            return
+        # Lines keep their trailing newline; both parsers ignore it
+        yield lines
+
+def _watch_log_dir(path):
+    inotify = INotify()
+    try:
+        inotify.add_watch(
+            os.path.dirname(path),
+            inotify_flags.MODIFY | inotify_flags.CREATE | inotify_flags.MOVED_TO | inotify_flags.MOVED_FROM
+        )
+    except OSError:
+        inotify.close()
+        raise
+    return inotify
+
+def _tail_inotify(path, inotify):
+    """Block on inotify events for the log directory instead of polling."""
+    name = os.path.basename(path)
+    f = open(path, "r")
+    f.seek(0, 2)
+    try:
+        while True:
+            yield from _drain(f)
+
+            rotated = False
+            for event in inotify.read():
+                if event.name == name and event.mask & (inotify_flags.CREATE | inotify_flags.MOVED_TO):
+                    rotated = True
+            if rotated:
+                # Finish the rotated-out file, then follow the new one from the start
+                yield from _drain(f)
+                # If it was removed again before we got to it, the next CREATE/MOVED_TO retries
+                f = _reopen(path, f)
+    finally:
+        f.close()
+        inotify.close()
 
 # ====== MAIN LOOP ======
 def watch_logs():
-    global last_failover_pool, last_failover_alert, last_error_rate_alert, error_rate_breached, maintenance_mode_prev
-
-    log_console(f"Starting alert watcher on {LOG_PATH}")
-    with open(LOG_PATH, "r") as f:
-        for line in tail(f):
-            maintenance_mode_current = os.path.exists(MAINTENANCE_FILE)
-            if maintenance_mode_current != maintenance_mode_prev:
-                if maintenance_mode_current:
-                    send_slack_alert("🛠️ *Maintenance mode ENABLED — alerts suppressed*", alert_type="info")
-                else:
-                    send_slack_alert("✅ *Maintenance mode DISABLED — alerts resumed*", alert_type="info")
-                maintenance_mode_prev = maintenance_mode_current
-
-            match = LOG_REGEX.search(line)
-            if not match:
-                continue
-
-            pool = match.group("pool")
-            upstream_status = int(match.group("upstream_status"))
-            request_window.append(upstream_status)
-            now = datetime.utcnow()
-
-            if pool != last_failover_pool:
-                if (now - last_failover_alert).total_seconds() >= ALERT_COOLDOWN_SEC:
-                    send_slack_alert(
-                        f"Failover detected! Pool switched from `{last_failover_pool}` → `{pool}`",
-                        alert_type="failover",
-                        pool=pool
-                    )
-                    last_failover_alert = now
-                last_failover_pool = pool
-
-            elif pool == ACTIVE_POOL and last_failover_pool != ACTIVE_POOL:
-                if (now - last_failover_alert).total_seconds() >= ALERT_COOLDOWN_SEC:
-                    send_slack_alert(
-                        f"Primary pool `{ACTIVE_POOL}` is now serving traffic again.",
-                        alert_type="info",
-                        pool=ACTIVE_POOL
-                    )
-                    last_failover_alert = now
-                last_failover_pool = ACTIVE_POOL
-
-            if len(request_window) == WINDOW_SIZE:
-                error_count = sum(1 for s in request_window if 500 <= s <= 599)
-                error_rate = (error_count / WINDOW_SIZE) * 100
-                log_console(f"Error rate: {error_rate:.2f}% ({error_count} errors)")
-
-                if error_rate > ERROR_RATE_THRESHOLD:
-                    if not error_rate_breached and (now - last_error_rate_alert).total_seconds() >= ALERT_COOLDOWN_SEC:
-                        send_slack_alert(
-                            f"High error rate detected: {error_rate:.2f}% 5xx responses over last {WINDOW_SIZE} requests",
-                            alert_type="error_rate",
-                            pool=ACTIVE_POOL,
-                            error_rate=error_rate
-                        )
-                        last_error_rate_alert = now
-                        error_rate_breached = True
-                elif error_rate_breached and (now - last_error_rate_alert).total_seconds() >= ALERT_COOLDOWN_SEC:
-                    send_slack_alert(
-                        f"Error rate recovered: {error_rate:.2f}% 5xx responses over last {WINDOW_SIZE} requests",
-                        alert_type="info",
-                        pool=ACTIVE_POOL,
-                        error_rate=error_rate
-                    )
-                    last_error_rate_alert = now
-                    error_rate_breached = False
+    global maintenance_mode_prev
+
+    window_size = CONFIG.window_size
+    state = State(
+        active_pool=CONFIG.active_pool,
+        window_size=window_size,
+        error_rate_threshold=CONFIG.error_rate_threshold,
+        alert_cooldown_sec=CONFIG.alert_cooldown_sec,
+        parse=parse_line_regex if CONFIG.use_regex_parser else parse_line,
+    )
+
+    log_console(f"Starting alert watcher on {CONFIG.log_path}")
+    for batch in tail_batches(CONFIG.log_path):
+        maintenance_mode_current = maintenance_on()
+        if maintenance_mode_current != maintenance_mode_prev:
+            if maintenance_mode_current:
+                send_slack_alert("🛠️ *Maintenance mode ENABLED — alerts suppressed*", alert_type="info")
+            else:
+                send_slack_alert("✅ *Maintenance mode DISABLED — alerts resumed*", alert_type="info")
+            maintenance_mode_prev = maintenance_mode_current
+
+        if not process_batch(batch, state):
+            continue
+
+        if state.ring_filled == window_size:
+            log_console(f"Error rate: {state.error_rate:.2f}% ({state.error_count} errors)")
+
+        if state.alerts:
+            for message, alert_type, pool, error_rate in state.alerts:
+                send_slack_alert(message, alert_type=alert_type, pool=pool, error_rate=error_rate)
+            state.alerts.clear()
 
 # ====== FLASK CHAOS MODE ENDPOINT ======
-app = Flask(__name__)
+def run_chaos_http():
+    # Imported here so Flask/Werkzeug are only loaded when the endpoint is served
+    from flask import Flask
 
-@app.route('/chaos_mode/on', methods=['POST'])
-def chaos_mode():
-    send_slack_alert("Chaos mode triggered manually via HTTP", alert_type="info")
-    return "Chaos mode activated", 200
+    app = Flask(__name__)
+
+    @app.route('/chaos_mode/on', methods=['POST'])
+    def chaos_mode():
+        send_slack_alert("Chaos mode triggered manually via HTTP", alert_type="info")
+        return "Chaos mode activated", 200
 
-if __name__ == "__main__":
-    import threading
-    threading.Thread(target=watch_logs, daemon=True).start()
     app.run(host="0.0.0.0", port=3000)
+
+if __name__ == "__main__":
+    threading.Thread(target=_alert_worker, daemon=True).start()
+    if CONFIG.enable_chaos_http:
+        threading.Thread(target=watch_logs, daemon=True).start()
+        run_chaos_http()
+    else:
+        watch_logs()